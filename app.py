@@ -2,270 +2,683 @@
 """FastAPI service that converts Markdown to Word and returns a download URL.
 Supports headings, bullet lists, numbered lists, bold/italic, links, inline code, 
 code blocks, and GitHub‑style tables with borders + bold header row. 
-Files saved under /static/downloads/ ."""
+Files saved under /static/downloads/ , or returned directly with ?download=true ."""
 
-from fastapi import FastAPI, Body
+from fastapi import FastAPI, Body, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.background import BackgroundTask
 from docx import Document
 from docx.enum.style import WD_STYLE_TYPE
-from docx.table import _Cell
-from docx.oxml import OxmlElement
-from docx.oxml.ns import qn
-from docx.shared import Pt
+from docx.shared import Emu, Pt
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import IO
 from uuid import uuid4
+from xml.sax.saxutils import escape
+import asyncio
+import io
 import os
 import re
+import zipfile
 
-app = FastAPI()
+# md_to_docx is CPU-bound, so documents are rendered in worker processes
+# to let concurrent requests use every core instead of contending for the GIL
+_WORKERS = os.cpu_count() or 1
+# Created at startup and shut down when the app stops; _submit also creates
+# one when the app is used without its lifespan
+_POOL: ProcessPoolExecutor | None = None
+
+# Requests arriving close together are coalesced into batches so that one
+# executor round trip (pickling, pipe I/O, future bookkeeping) covers
+# several documents
+BATCH_MAX = 16
+BATCH_WAIT = 0.005  # seconds to wait for more requests when they are piling up
+# Larger documents skip batching and are themselves split across the workers
+PARALLEL_MIN_CHARS = 256 * 1024
+_batch_queue: asyncio.Queue | None = None
+_batcher: asyncio.Task | None = None
+_in_flight = 0  # groups submitted to the pool and not yet resolved
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    global _batch_queue, _batcher, _POOL
+    _POOL = ProcessPoolExecutor(max_workers=_WORKERS)
+    yield
+    if _batcher is not None:
+        _batcher.cancel()
+    _batch_queue = _batcher = None
+    _POOL.shutdown()
+    _POOL = None
+
+app = FastAPI(lifespan=_lifespan)
 BASE_DIR = "generated"
 SUB_DIR = "downloads"
 OUTPUT_DIR = os.path.join(BASE_DIR, SUB_DIR)
+DOCX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+MAX_MD_CHARS = 2_000_000  # larger payloads are rejected with 413
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
-app.mount("/static", StaticFiles(directory=BASE_DIR), name="static")
+
+# Recently generated documents are kept in memory so the usual "POST, then
+# GET the download URL" sequence is served without touching the disk
+CACHE_MAX_DOCS = 200
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+_doc_cache: OrderedDict[str, bytes] = OrderedDict()
+_doc_cache_bytes = 0
+# Requests that need file metadata skip the cache and go to StaticFiles
+_FILE_ONLY_HEADERS = {"range", "if-range", "if-none-match", "if-modified-since"}
+_static_files = StaticFiles(directory=BASE_DIR)
 
 # Regex patterns
-_hdr1 = re.compile(r"^# (.+)")
-_hdr2 = re.compile(r"^## (.+)")
-_hdr3 = re.compile(r"^### (.+)")
-_bullet = re.compile(r"^[-*] (.+)")
-_numbered = re.compile(r"^(\d+)\. (.+)")
-_nested_bullet = re.compile(r"^  [-*] (.+)")
-_nested_numbered = re.compile(r"^  (\d+)\. (.+)")
-_table_row = re.compile(r"^\|(.+)\|$")
-_table_divider = re.compile(r"^[\|\s:-]+$")
-_code_block = re.compile(r"^```")
-_bold = re.compile(r"\*\*(.+?)\*\*")
-_italic = re.compile(r"\*(.+?)\*")
-_inline_code = re.compile(r"`(.+?)`")
-_link = re.compile(r"\[([^\]]+)\]\(([^)]+)\)")
-_html_strong = re.compile(r"<strong>(.+?)</strong>", re.IGNORECASE)
-_invalid_fname = re.compile(r"[^A-Za-z0-9_.-]")
+# Every pattern is compiled here, once, at import. Request handling only calls
+# methods on these objects and never re.compile()/re.match() etc., so it never
+# goes through the re module's internal pattern cache.
+_numbered = re.compile(r"\d+\. ")
+# Same boundaries as str.splitlines(), but lets md_to_docx pull lines lazily
+_LINE_SEPS = "\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029"
+# Matches only the separator, so each search attempt is constant work and a
+# final line without a trailing newline isn't rescanned from every position
+_line_break = re.compile(f"\r\n|[{_LINE_SEPS}]")
+_LINE_SEPS_KEPT = {"\r\n", *_LINE_SEPS}  # what an empty line is with keepends=True
+# Inline tokenizer: alternation order gives bold > italic > code > link
+# priority when several formats start at the same position.
+_INLINE = re.compile(
+    r"\*\*(?P<b>.+?)\*\*|\*(?P<i>.+?)\*|`(?P<c>.+?)`"
+    r"|\[(?P<lt>[^\]]+)\]\((?P<lu>[^)]+)\)"
+)
+# Characters python-docx turns into <w:tab/> and <w:br/> inside a run
+_run_specials = re.compile(r"([\t\r\n])")
+# Tag names are ASCII, so case-insensitive matching needs no Unicode case folding
+_html_strong = re.compile(r"<strong>(.+?)</strong>", re.IGNORECASE | re.ASCII)
+_invalid_fname = re.compile(r"[^A-Za-z0-9_.-]", re.ASCII)
+# Byte-level equivalent of _invalid_fname for ASCII names
+_FNAME_ALLOWED = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_.-"
+_FNAME_TABLE = bytes(c if c in _FNAME_ALLOWED else ord("_") for c in range(256))
+# Characters XML 1.0 doesn't allow (surrogates already fail to encode)
+_xml_invalid = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+# Table border markup shared by every table. The inside edges make Word
+# draw the grid without per-cell borders.
+_TABLE_BORDERS_XML = (
+    "<w:tblBorders>"
+    + "".join(
+        f'<w:{edge} w:val="single" w:sz="4" w:space="0" w:color="auto"/>'
+        for edge in ("top", "left", "bottom", "right", "insideH", "insideV")
+    )
+    + "</w:tblBorders>"
+)
+_BOLD = "<w:b/>"
+_ITALIC = "<w:i/>"
+_HYPERLINK_RT = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/hyperlink"
+# Entities lxml writes in attribute values beyond escape()'s &, < and >
+_ATTR_ENTITIES = {'"': "&quot;", "\t": "&#9;", "\n": "&#10;", "\r": "&#13;"}
+_RID_MARK = "\x00"  # placeholder for hyperlink ids in separately rendered pieces
 
 # Helper functions
+# The document body is rendered as OOXML strings and zipped up with the
+# template's other parts, instead of growing it through python-docx's
+# paragraph/run object model and saving that. Each helper reproduces the
+# markup python-docx would have serialized.
 
-def _set_cell_border(cell: _Cell):
-    tcPr = cell._tc.get_or_add_tcPr()
-    for edge in ("top", "left", "bottom", "right"):
-        ln = OxmlElement(f"w:{edge}")
-        ln.set(qn("w:val"), "single")
-        ln.set(qn("w:sz"), "4")
-        ln.set(qn("w:space"), "0")
-        ln.set(qn("w:color"), "auto")
-        tcPr.append(ln)
+def _text_xml(text: str) -> str:
+    space = ' xml:space="preserve"' if text != text.strip() else ""
+    return f"<w:t{space}>{escape(text)}</w:t>"
+
+def _run_xml(text: str, props: str = "") -> str:
+    """Render `text` as a <w:r>, matching python-docx's handling of tabs and newlines"""
+    if "\t" not in text and "\n" not in text and "\r" not in text:
+        content = _text_xml(text) if text else ""
+    else:
+        parts = []
+        for segment in _run_specials.split(text):
+            if segment == "\t":
+                parts.append("<w:tab/>")
+            elif segment == "\n" or segment == "\r":
+                parts.append("<w:br/>")
+            elif segment:
+                parts.append(_text_xml(segment))
+        content = "".join(parts)
+    rpr = f"<w:rPr>{props}</w:rPr>" if props else ""
+    # lxml serializes elements without children as self-closing
+    return f"<w:r>{rpr}{content}</w:r>" if rpr or content else "<w:r/>"
+
+def _paragraph_xml(runs: str, style_id: str = "") -> str:
+    ppr = f'<w:pPr><w:pStyle w:val="{style_id}"/></w:pPr>' if style_id else ""
+    return f"<w:p>{ppr}{runs}</w:p>" if ppr or runs else "<w:p/>"
+
+def _table_xml(header: list[str], rows: list[list[str]]) -> str:
+    """Render a bordered table with a bold header row, laid out like doc.add_table()"""
+    width = Emu(_BLOCK_WIDTH // len(header)).twips
+    tc_pr = f'<w:tcPr><w:tcW w:type="dxa" w:w="{width}"/></w:tcPr>'
+    trs = "".join(
+        "<w:tr>"
+        + "".join(f"<w:tc>{tc_pr}<w:p>{_run_xml(txt, props)}</w:p></w:tc>" for txt in cells)
+        + "</w:tr>"
+        for cells, props in [(header, _BOLD)] + [(row, "") for row in rows]
+    )
+    return (
+        '<w:tbl><w:tblPr><w:tblW w:type="auto" w:w="0"/>'
+        + _TABLE_BORDERS_XML
+        + '<w:tblLook w:firstColumn="1" w:firstRow="1" w:lastColumn="0" w:lastRow="0"'
+        ' w:noHBand="0" w:noVBand="1" w:val="04A0"/></w:tblPr>'
+        + "<w:tblGrid>" + f'<w:gridCol w:w="{width}"/>' * len(header) + "</w:tblGrid>"
+        + trs
+        + "</w:tbl>"
+    )
+
+def _ensure_list_styles(doc):
+    """Ensure required styles exist"""
+    style_names = {s.name for s in doc.styles}
+    for name in ("List Bullet", "List Number", "List Bullet 2", "List Number 2"):
+        if name not in style_names:
+            doc.styles.add_style(name, WD_STYLE_TYPE.PARAGRAPH).base_style = doc.styles["Normal"]
 
 def _safe_filename(name: str | None) -> str:
     if not name:
         return f"{uuid4()}.docx"
-    name = _invalid_fname.sub("_", name).strip("._") or str(uuid4())
+    if name.isascii():
+        name = name.encode("ascii").translate(_FNAME_TABLE).decode("ascii")
+    else:
+        name = _invalid_fname.sub("_", name)
+    name = name.strip("._") or str(uuid4())
     if not name.lower().endswith(".docx"):
         name += ".docx"
     return name
 
-def _inline_formats(par, text: str):
-    """Process inline formatting including bold, italic, inline code, and links"""
+def _inline_xml(part, text: str) -> str:
+    """Render inline formatting including bold, italic, inline code, and links as runs"""
+    # Fast path: every format needs one of these characters
+    if "*" not in text and "`" not in text and "[" not in text:
+        return _run_xml(text) if text else ""
+
+    runs = []
     pos = 0
-    while pos < len(text):
-        # Find all possible matches
-        matches = []
-        
-        for pattern, format_type in [
-            (_bold, 'bold'),
-            (_italic, 'italic'), 
-            (_inline_code, 'code'),
-            (_link, 'link')
-        ]:
-            match = pattern.search(text, pos)
-            if match:
-                matches.append((match.start(), match, format_type))
-        
-        if not matches:
-            # No more formatting, add remaining text
-            par.add_run(text[pos:])
-            break
-        
-        # Sort by position to handle earliest match first
-        matches.sort(key=lambda x: x[0])
-        earliest_pos, match, format_type = matches[0]
-        
+    for m in _INLINE.finditer(text):
         # Add text before the match
-        if earliest_pos > pos:
-            par.add_run(text[pos:earliest_pos])
+        if m.start() > pos:
+            runs.append(_run_xml(text[pos:m.start()]))
         
-        # Add formatted text
-        if format_type == 'link':
-            # For links, create hyperlink
-            link_text = match.group(1)
-            link_url = match.group(2)
-            hyperlink = par.add_run(link_text)
-            # Add hyperlink relationship
-            r_id = par.part.relate_to(link_url, "http://schemas.openxmlformats.org/officeDocument/2006/relationships/hyperlink", is_external=True)
-            hyperlink_elem = OxmlElement('w:hyperlink')
-            hyperlink_elem.set(qn('r:id'), r_id)
-            new_run = OxmlElement('w:r')
-            new_run.append(hyperlink._element)
-            hyperlink_elem.append(new_run)
-            par._element.append(hyperlink_elem)
+        kind = m.lastgroup
+        if kind == "lu":
+            # For links, add the hyperlink relationship and wrap the link text
+            r_id = part.relate_to(m["lu"], _HYPERLINK_RT, is_external=True)
+            runs.append(f'<w:hyperlink r:id="{r_id}"><w:r>{_run_xml(m["lt"])}</w:r></w:hyperlink>')
+        elif kind == "b":
+            runs.append(_run_xml(m[kind], _BOLD))
+        elif kind == "i":
+            runs.append(_run_xml(m[kind], _ITALIC))
         else:
-            run = par.add_run(match.group(1))
-            if format_type == 'bold':
-                run.bold = True
-            elif format_type == 'italic':
-                run.italic = True
-            elif format_type == 'code':
-                # Plain text for inline code as requested
-                pass
+            # Plain text for inline code as requested
+            runs.append(_run_xml(m[kind]))
         
-        pos = match.end()
-
-def _is_valid_table_structure(lines, start_idx):
-    """Check if we have a valid table structure starting at start_idx"""
-    if start_idx >= len(lines):
-        return False
+        pos = m.end()
     
+    # No more formatting, add remaining text
+    if pos < len(text):
+        runs.append(_run_xml(text[pos:]))
+    return "".join(runs)
+
+def _emit_heading(part, text: str, style_id: str) -> str:
+    return _paragraph_xml(_run_xml(text), style_id)
+
+def _emit_list_item(part, text: str, style_id: str) -> str:
+    return _paragraph_xml(_inline_xml(part, text), style_id)
+
+def _code_block_xml(code_content: list[str]) -> str:
+    return _paragraph_xml("".join(_run_xml(code_line + "\n") for code_line in code_content))
+
+# Every request reuses this document's saved parts; only the main document
+# part and its relationships differ between requests
+_TEMPLATE_DOC = Document()
+_ensure_list_styles(_TEMPLATE_DOC)
+_BLOCK_WIDTH = _TEMPLATE_DOC._block_width
+
+_DOCUMENT_PART = "word/document.xml"
+_DOCUMENT_RELS_PART = "word/_rels/document.xml.rels"
+
+def _template_parts(doc) -> tuple[bytes, str, str]:
+    """Save `doc` once and return its static parts as a zip, plus the XML of
+    the two parts rendered per request"""
+    saved = io.BytesIO()
+    doc.save(saved)
+    static = io.BytesIO()
+    with zipfile.ZipFile(saved) as src, zipfile.ZipFile(static, "w", zipfile.ZIP_DEFLATED) as dst:
+        for info in src.infolist():
+            if info.filename not in (_DOCUMENT_PART, _DOCUMENT_RELS_PART):
+                dst.writestr(info, src.read(info))
+        document = src.read(_DOCUMENT_PART).decode("utf-8")
+        rels = src.read(_DOCUMENT_RELS_PART).decode("utf-8")
+    return static.getvalue(), document, rels
+
+_STATIC_ZIP, _document_xml, _rels_xml = _template_parts(_TEMPLATE_DOC)
+# The template body holds only its sectPr; blocks go in ahead of it
+_DOCUMENT_HEAD, _DOCUMENT_TAIL = _document_xml.split("<w:sectPr", 1)
+_DOCUMENT_TAIL = "<w:sectPr" + _DOCUMENT_TAIL
+_RELS_HEAD, _RELS_TAIL = _rels_xml.rsplit("</Relationships>", 1)
+_RELS_TAIL = "</Relationships>" + _RELS_TAIL
+# The template's relationships are rId1..rIdN, so python-docx numbers new ones from N + 1
+_RID_BASE = len(_TEMPLATE_DOC.part.rels) + 1
+
+def _style_id(name: str) -> str:
+    return _TEMPLATE_DOC.styles[name].style_id
+
+_LINE_HANDLERS = {
+    "h1": partial(_emit_heading, style_id=_style_id("Heading 1")),
+    "h2": partial(_emit_heading, style_id=_style_id("Heading 2")),
+    "h3": partial(_emit_heading, style_id=_style_id("Heading 3")),
+    "nb": partial(_emit_list_item, style_id=_style_id("List Bullet 2")),
+    "nn": partial(_emit_list_item, style_id=_style_id("List Number 2")),
+    "b": partial(_emit_list_item, style_id=_style_id("List Bullet")),
+    "n": partial(_emit_list_item, style_id=_style_id("List Number")),
+}
+
+def _iter_lines(text: str):
+    """Yield the lines of `text` like str.splitlines() without building a list"""
+    pos = 0
+    for m in _line_break.finditer(text):
+        yield text[pos:m.start()]
+        pos = m.end()
+    if pos < len(text):
+        yield text[pos:]
+
+def _classify(line: str) -> tuple[str | None, int]:
+    """Return the line kind and the offset where its item text starts.
+
+    Kinds: h1-h3 headings, nb/nn nested bullet/numbered items, b/n top-level
+    bullet/numbered items, tr a possible table row, None for a paragraph.
+    Literal prefixes are decided on the first characters; only numbered items
+    need a regex.
+    """
+    c0 = line[:1]
+    if c0 == "#":
+        if line.startswith("# "):
+            return "h1", 2
+        if line.startswith("## "):
+            return "h2", 3
+        if line.startswith("### "):
+            return "h3", 4
+    elif c0 == "-" or c0 == "*":
+        if line[1:2] == " ":
+            return "b", 2
+    elif c0 == "|":
+        return "tr", 1
+    elif c0 == " ":
+        if line[1:2] == " ":
+            c2 = line[2:3]
+            if (c2 == "-" or c2 == "*") and line[3:4] == " ":
+                return "nb", 4
+            if c2.isdecimal() and (m := _numbered.match(line, 2)):
+                return "nn", m.end()
+    elif c0.isdecimal() and (m := _numbered.match(line)):
+        return "n", m.end()
+    return None, 0
+
+def _is_table_row(s: str) -> bool:
+    r"""Equivalent to matching ^\|(.+)\|$ on a single line"""
+    return len(s) > 2 and s[0] == "|" and s[-1] == "|"
+
+def _is_table_divider(s: str) -> bool:
+    r"""Equivalent to matching ^[\|\s:-]+$ on a single line"""
+    rest = s.replace("|", "").replace(":", "").replace("-", "")
+    return bool(s) and (not rest or rest.isspace())
+
+def _split_row(line: str) -> list[str]:
+    return [c.strip() for c in line.strip("|").split("|")]
+
+def _parse_row(line: str, ncols: int) -> list[str]:
+    """Split a data row, padding or truncating it to the header's column count"""
+    cells = _split_row(line)
+    if len(cells) < ncols:
+        cells += [""] * (ncols - len(cells))
+    return cells[:ncols]
+
+def _next_line(peek: deque, lines):
+    """Return the next line, consuming the lookahead buffer first (None at end)"""
+    return peek.popleft() if peek else next(lines, None)
+
+def _peek_is_table(line: str, peek: deque, lines) -> bool:
+    """Check if `line` starts a valid table, pulling up to two lines into `peek`"""
     # Must have header row
-    if not _table_row.match(lines[start_idx]):
+    if not _is_table_row(line):
         return False
     
+    while len(peek) < 2:
+        nxt = next(lines, None)
+        if nxt is None:
+            break
+        peek.append(nxt)
+    
     # Must have divider row
-    if start_idx + 1 >= len(lines) or not _table_divider.match(lines[start_idx + 1]):
+    if len(peek) < 1 or not _is_table_divider(peek[0]):
         return False
     
     # Must have at least one data row
-    if start_idx + 2 >= len(lines) or not _table_row.match(lines[start_idx + 2]):
+    if len(peek) < 2 or not _is_table_row(peek[1]):
         return False
     
     return True
 
-def md_to_docx(md: str, path: str):
-    doc = Document()
-    
-    # Ensure required styles exist
-    style_names = [s.name for s in doc.styles]
-    if "List Bullet" not in style_names:
-        doc.styles.add_style("List Bullet", WD_STYLE_TYPE.PARAGRAPH).base_style = doc.styles["Normal"]
-    if "List Number" not in style_names:
-        doc.styles.add_style("List Number", WD_STYLE_TYPE.PARAGRAPH).base_style = doc.styles["Normal"]
-    if "List Bullet 2" not in style_names:
-        bullet2_style = doc.styles.add_style("List Bullet 2", WD_STYLE_TYPE.PARAGRAPH)
-        bullet2_style.base_style = doc.styles["Normal"]
-    if "List Number 2" not in style_names:
-        number2_style = doc.styles.add_style("List Number 2", WD_STYLE_TYPE.PARAGRAPH)
-        number2_style.base_style = doc.styles["Normal"]
-
-    lines = md.splitlines()
-    i = 0
+def _body_xml(md: str, part) -> str:
+    """Render `md` as OOXML body content, relating link targets on `part`"""
+    body = []  # OOXML fragments, parsed once at the end
+
+    lines = _iter_lines(md)
+    peek = deque()  # lookahead for table detection, at most two lines
+    fenced = "```" in md  # skip the per-line fence check for documents without code blocks
     in_code_block = False
     code_content = []
     
-    while i < len(lines):
-        line = lines[i]
-        
+    while (line := _next_line(peek, lines)) is not None:
         # Handle code blocks
-        if _code_block.match(line):
+        if fenced and line.startswith("```"):
             if in_code_block:
                 # End of code block - add as plain text
                 if code_content:
-                    p = doc.add_paragraph()
-                    for code_line in code_content:
-                        p.add_run(code_line + "\n")
+                    body.append(_code_block_xml(code_content))
                 code_content = []
                 in_code_block = False
             else:
                 # Start of code block
                 in_code_block = True
-            i += 1
             continue
         
         if in_code_block:
             code_content.append(line)
-            i += 1
             continue
         
+        # Blank lines never produce output, skip them before any dispatch
+        if not line or line.isspace():
+            continue
+        
+        kind, start = _classify(line)
+        
         # Handle tables - but only if structure is valid
-        if _table_row.match(line) and _is_valid_table_structure(lines, i):
-            header = [c.strip() for c in line.strip("|").split("|")]
+        if kind == "tr" and _peek_is_table(line, peek, lines):
+            header = _split_row(line)
             
             # Skip divider row
-            i += 2
+            peek.popleft()
             
-            # Collect data rows
+            # Collect data rows, pushing back the first line that is not one
             rows = []
-            while i < len(lines) and _table_row.match(lines[i]):
-                row_data = [c.strip() for c in lines[i].strip("|").split("|")]
-                # Ensure row has same number of columns as header
-                while len(row_data) < len(header):
-                    row_data.append("")
-                rows.append(row_data[:len(header)])  # Truncate if too many columns
-                i += 1
+            while (row_line := _next_line(peek, lines)) is not None and _is_table_row(row_line):
+                rows.append(_parse_row(row_line, len(header)))
+            if row_line is not None:
+                peek.appendleft(row_line)
             
             # Create table
-            tbl = doc.add_table(rows=len(rows)+1, cols=len(header))
-            
-            # Add header row
-            for c, txt in enumerate(header):
-                cell = tbl.rows[0].cells[c]
-                cell.text = txt
-                for run in cell.paragraphs[0].runs:
-                    run.bold = True
-                _set_cell_border(cell)
-            
-            # Add data rows
-            for r, row in enumerate(rows, start=1):
-                for c, txt in enumerate(row):
-                    cell = tbl.rows[r].cells[c]
-                    cell.text = txt
-                    _set_cell_border(cell)
+            body.append(_table_xml(header, rows))
             
             continue
         
-        # Handle headings
-        if m := _hdr1.match(line):
-            doc.add_heading(m.group(1), level=1)
-        elif m := _hdr2.match(line):
-            doc.add_heading(m.group(1), level=2)
-        elif m := _hdr3.match(line):
-            doc.add_heading(m.group(1), level=3)
-        # Handle nested lists
-        elif m := _nested_bullet.match(line):
-            p = doc.add_paragraph()
-            p.style = "List Bullet 2"
-            _inline_formats(p, m.group(1))
-        elif m := _nested_numbered.match(line):
-            p = doc.add_paragraph()
-            p.style = "List Number 2"  
-            _inline_formats(p, m.group(2))
-        # Handle top-level lists
-        elif m := _bullet.match(line):
-            p = doc.add_paragraph()
-            p.style = "List Bullet"
-            _inline_formats(p, m.group(1))
-        elif m := _numbered.match(line):
-            p = doc.add_paragraph()
-            p.style = "List Number"
-            _inline_formats(p, m.group(2))
+        # Handle headings and lists (the item text must be non-empty)
+        handler = _LINE_HANDLERS.get(kind)
+        if handler and len(line) > start:
+            body.append(handler(part, line[start:]))
         else:
             # Regular paragraph
-            plain = _html_strong.sub(r"**\1**", line)
+            plain = _html_strong.sub(r"**\1**", line) if "<" in line else line
             if plain.strip():  # Only add non-empty paragraphs
-                p = doc.add_paragraph()
-                _inline_formats(p, plain)
-        
-        i += 1
+                body.append(_paragraph_xml(_inline_xml(part, plain)))
     
     # Handle any remaining code block content
     if in_code_block and code_content:
-        p = doc.add_paragraph()
-        for code_line in code_content:
-            p.add_run(code_line + "\n")
+        body.append(_code_block_xml(code_content))
     
-    doc.save(path)
+    return "".join(body)
+
+class _HyperlinkRels:
+    """Stands in for the document part: gives each link target the
+    relationship id python-docx would, and renders those relationships.
+    """
+    def __init__(self):
+        self.ids = {}  # target -> rId, in the order they were related
+
+    def relate_to(self, target: str, reltype: str, is_external: bool = False) -> str:
+        rid = self.ids.get(target)
+        if rid is None:
+            rid = self.ids[target] = f"rId{_RID_BASE + len(self.ids)}"
+        return rid
+
+    def xml(self) -> str:
+        return "".join(
+            f'<Relationship Id="{rid}" Type="{_HYPERLINK_RT}" Target="{escape(target, _ATTR_ENTITIES)}"'
+            ' TargetMode="External"/>'
+            for target, rid in self.ids.items()
+        )
+
+def _docx_bytes(body: str, rels: _HyperlinkRels) -> bytes:
+    """Zip the rendered body and its relationships with the template's static parts"""
+    links = rels.xml()
+    # parse_xml used to reject these; don't write an unreadable document instead
+    if _xml_invalid.search(body) or _xml_invalid.search(links):
+        raise ValueError("markdown contains characters not allowed in XML")
+    buf = io.BytesIO(_STATIC_ZIP)
+    with zipfile.ZipFile(buf, "a", zipfile.ZIP_DEFLATED) as z:
+        z.writestr(_DOCUMENT_PART, (_DOCUMENT_HEAD + body + _DOCUMENT_TAIL).encode("utf-8"))
+        z.writestr(_DOCUMENT_RELS_PART, (_RELS_HEAD + links + _RELS_TAIL).encode("utf-8"))
+    return buf.getvalue()
+
+def md_to_docx_bytes(md: str) -> bytes:
+    """Render `md` and return the DOCX file contents"""
+    rels = _HyperlinkRels()
+    return _docx_bytes(_body_xml(md, rels), rels)
+
+def md_to_docx(md: str, path: str | IO[bytes]):
+    data = md_to_docx_bytes(md)
+    if isinstance(path, str):
+        with open(path, "wb") as f:
+            f.write(data)
+    else:
+        path.write(data)
+
+def _split_markdown(md: str, parts: int) -> list[str]:
+    """Cut `md` into about `parts` pieces at empty lines outside code blocks.
+
+    No parser state (code block, table lookahead) crosses such a line, so the
+    pieces' bodies concatenated equal the body of the whole document.
+    """
+    target = -(-len(md) // parts)
+    chunks = []
+    start = size = 0
+    in_code_block = False
+    lines = md.splitlines(keepends=True)
+    for i, line in enumerate(lines):
+        if line.startswith("```"):
+            in_code_block = not in_code_block
+        elif size >= target and not in_code_block and line in _LINE_SEPS_KEPT:
+            chunks.append("".join(lines[start:i]))
+            start, size = i, 0
+        size += len(line)
+    chunks.append("".join(lines[start:]))
+    return chunks
+
+class _LinkRecorder:
+    """Stands in for the document part while a worker renders one piece.
+
+    Link targets are recorded in order and _RID_MARK is left where each
+    relationship id goes, to be filled in by _assemble_docx.
+    """
+    def __init__(self):
+        self.urls = []
+
+    def relate_to(self, target: str, reltype: str, is_external: bool = False) -> str:
+        self.urls.append(target)
+        return _RID_MARK
+
+def _piece_body_xml(md: str) -> tuple[str, list[str]]:
+    recorder = _LinkRecorder()
+    return _body_xml(md, recorder), recorder.urls
+
+def _assemble_docx(pieces: list[tuple[str, list[str]]]) -> bytes:
+    """Build the DOCX from rendered pieces, relating links in document order"""
+    rels = _HyperlinkRels()
+    xml = []
+    for body, urls in pieces:
+        frags = body.split(_RID_MARK)
+        xml.append(frags[0])
+        for url, frag in zip(urls, frags[1:]):
+            xml.append(rels.relate_to(url, _HYPERLINK_RT, is_external=True))
+            xml.append(frag)
+    return _docx_bytes("".join(xml), rels)
+
+def _render_batch(mds: list[str]) -> list[bytes | Exception]:
+    """Render several documents in one worker call, keeping failures per item"""
+    results = []
+    for md in mds:
+        try:
+            results.append(md_to_docx_bytes(md))
+        except Exception as exc:
+            results.append(exc)
+    return results
+
+def _resolve_batch(group: list, fut: asyncio.Future):
+    global _in_flight
+    _in_flight -= 1
+    if fut.cancelled():
+        return
+    exc = fut.exception()
+    results = [exc] * len(group) if exc else fut.result()
+    for (_, waiter), result in zip(group, results):
+        if waiter.done():
+            continue
+        if isinstance(result, Exception):
+            waiter.set_exception(result)
+        else:
+            waiter.set_result(result)
+
+def _submit(fn, *args) -> asyncio.Future:
+    """Run `fn` on the worker pool, replacing the pool if a worker has died"""
+    global _POOL
+    loop = asyncio.get_running_loop()
+    if _POOL is None:
+        _POOL = ProcessPoolExecutor(max_workers=_WORKERS)
+    try:
+        return loop.run_in_executor(_POOL, fn, *args)
+    except BrokenProcessPool:
+        # Work already submitted to the old pool fails on its own futures
+        _POOL.shutdown(wait=False)
+        _POOL = ProcessPoolExecutor(max_workers=_WORKERS)
+        return loop.run_in_executor(_POOL, fn, *args)
+
+async def _run_batcher(queue: asyncio.Queue):
+    global _in_flight
+    while True:
+        batch = [await queue.get()]
+        # Hold the batch open only when requests are piling up; an idle
+        # worker gets a lone request straight away
+        if (not queue.empty() or _in_flight >= _WORKERS) and queue.qsize() < BATCH_MAX - 1:
+            await asyncio.sleep(BATCH_WAIT)
+        while len(batch) < BATCH_MAX and not queue.empty():
+            batch.append(queue.get_nowait())
+        # Spread the batch over the workers so batching does not cost
+        # parallelism, and don't wait for it before collecting the next one
+        size = -(-len(batch) // _WORKERS)
+        for i in range(0, len(batch), size):
+            group = batch[i:i + size]
+            try:
+                fut = _submit(_render_batch, [md for md, _ in group])
+            except Exception as exc:
+                # Fail these requests but keep serving the queue
+                for _, waiter in group:
+                    if not waiter.done():
+                        waiter.set_exception(exc)
+                continue
+            _in_flight += 1
+            fut.add_done_callback(partial(_resolve_batch, group))
+
+def _get_batch_queue() -> asyncio.Queue:
+    """Return the batch queue, starting the batcher on first use in this event loop"""
+    global _batch_queue, _batcher, _in_flight
+    loop = asyncio.get_running_loop()
+    if _batcher is None or _batcher.done() or _batcher.get_loop() is not loop:
+        _batch_queue = asyncio.Queue()
+        _batcher = loop.create_task(_run_batcher(_batch_queue))
+        _in_flight = 0
+    return _batch_queue
+
+async def _render_parallel(pieces: list[str]) -> bytes:
+    bodies = await asyncio.gather(*(_submit(_piece_body_xml, piece) for piece in pieces))
+    return await _submit(_assemble_docx, bodies)
+
+async def _render(md: str) -> bytes:
+    # NUL can't occur in valid OOXML, so it's free to mark link ids; documents
+    # containing it take the normal path and fail there as before
+    if _WORKERS > 1 and len(md) >= PARALLEL_MIN_CHARS and _RID_MARK not in md:
+        pieces = _split_markdown(md, _WORKERS)
+        if len(pieces) > 1:
+            return await _render_parallel(pieces)
+    waiter = asyncio.get_running_loop().create_future()
+    _get_batch_queue().put_nowait((md, waiter))
+    return await waiter
+
+def _write_output(fname: str, data: bytes):
+    with open(os.path.join(OUTPUT_DIR, fname), "wb") as f:
+        f.write(data)
+
+def _drop_cached_pages(fname: str):
+    """Write a saved document back and drop its pages from the page cache.
+
+    The follow-up GET is served from _doc_cache, so the pages aren't needed,
+    and Linux only drops clean ones. Runs after the response has been sent.
+    """
+    try:
+        with open(os.path.join(OUTPUT_DIR, fname), "rb") as f:
+            os.fdatasync(f.fileno())
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+    except FileNotFoundError:
+        pass
+
+def _cache_put(fname: str, data: bytes):
+    """Store `data` as the most recent entry, evicting the oldest ones over the caps"""
+    global _doc_cache_bytes
+    old = _doc_cache.pop(fname, None)
+    if old is not None:
+        _doc_cache_bytes -= len(old)
+    if len(data) > CACHE_MAX_BYTES:
+        return
+    _doc_cache[fname] = data
+    _doc_cache_bytes += len(data)
+    while len(_doc_cache) > CACHE_MAX_DOCS or _doc_cache_bytes > CACHE_MAX_BYTES:
+        _, evicted = _doc_cache.popitem(last=False)
+        _doc_cache_bytes -= len(evicted)
 
 @app.post("/docx")
-def make_docx(payload: dict = Body(...)):
+async def make_docx(payload: dict = Body(...), download: bool = False):
     md = payload["markdown"]
+    if len(md) > MAX_MD_CHARS:
+        raise HTTPException(413, f"markdown exceeds {MAX_MD_CHARS} characters")
     fname = _safe_filename(payload.get("filename"))
-    full = os.path.join(OUTPUT_DIR, fname)
-    md_to_docx(md, full)
+    data = await _render(md)
+    if download:
+        # Return the document itself and skip the disk entirely
+        return Response(
+            data,
+            media_type=DOCX_MEDIA_TYPE,
+            headers={"Content-Disposition": f'attachment; filename="{fname}"'},
+        )
+    await asyncio.to_thread(_write_output, fname, data)
+    _cache_put(fname, data)
     host = os.environ.get("RENDER_EXTERNAL_HOSTNAME", "localhost")
-    return {"download_url": f"https://{host}/static/{SUB_DIR}/{fname}"}
+    # A ready response skips FastAPI's jsonable_encoder pass over the dict
+    return JSONResponse(
+        {"download_url": f"https://{host}/static/{SUB_DIR}/{fname}"},
+        background=BackgroundTask(_drop_cached_pages, fname) if hasattr(os, "posix_fadvise") else None,
+    )
+
+@app.api_route(f"/static/{SUB_DIR}/{{fname}}", methods=["GET", "HEAD"])
+async def get_docx(fname: str, request: Request):
+    # Only names _safe_filename could have produced, so nothing outside OUTPUT_DIR
+    if _safe_filename(fname) != fname:
+        raise HTTPException(404)
+    # Plain GETs of recent documents come from memory; everything else (HEAD,
+    # ranges, conditional requests, older files) is served as StaticFiles did
+    data = _doc_cache.get(fname)
+    if data is not None and request.method == "GET" and _FILE_ONLY_HEADERS.isdisjoint(request.headers.keys()):
+        _doc_cache.move_to_end(fname)
+        return Response(data, media_type=DOCX_MEDIA_TYPE)
+    return await _static_files.get_response(f"{SUB_DIR}/{fname}", request.scope)